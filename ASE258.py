@@ -44,13 +44,14 @@ bl_info = {
 --  UDK Thread at http://forums.epicgames.com/threads/776986-Blender-2-57-ASE-export
 """
 
+import io
 import os
 import bpy
 import math
 import time
 
 # settings
-aseFloat = lambda x: '''{0: 0.4f}'''.format( x )
+aseFloat = '''% 0.4f'''.__mod__
 optionScale = 16.0
 optionSubmaterials = False
 optionSmoothingGroups = True
@@ -60,13 +61,15 @@ optionAllowMultiMats = True
 aseHeader = ''
 aseScene = ''
 aseMaterials = ''
-aseGeometry = ''
 
 # Other
 matList = []
 numMats = 0
 currentMatId = 0
 
+# Characters in object names that can't appear in a separate file's name
+fileNameChars = str.maketrans( './\\', '___' )
+
 #== Error ==================================================================
 class Error( Exception ):
 
@@ -111,6 +114,8 @@ class cMaterials:
         global numMats
 
         self.material_list = []
+        # Names already in material_list, for constant time checks
+        seen = set()
 
         # Get all of the materials used by non-collision object meshes  
         for object in bpy.context.selected_objects:
@@ -122,7 +127,8 @@ class cMaterials:
                 print( object.name + ': Constructing Materials' )
                 for slot in object.material_slots:
                     # if the material is not in the material_list, add it
-                    if self.material_list.count( slot.material ) == 0:
+                    if slot.material.name not in seen:
+                        seen.add( slot.material.name )
                         self.material_list.append( slot.material )
                         matList.append( slot.material.name )
 
@@ -144,16 +150,18 @@ class cMultiMaterials:
     def __init__( self, material_list ):
         self.numMtls = len( material_list )
         # Initialize material information
-        self.dump = '''*MATERIAL_LIST {{\
+        dump = io.StringIO()
+        dump.write( '''*MATERIAL_LIST {{\
                     \n\t*MATERIAL_COUNT {0}\
-                    '''.format( str( self.numMtls ) )
+                    '''.format( str( self.numMtls ) ) )
 
         for index, slot in enumerate( material_list ):
-            self.dump += '''\n\t*MATERIAL {0} {{\
+            dump.write( '''\n\t*MATERIAL {0} {{\
                             {1}\
-                            \n\t}}'''.format( index, cMaterial( slot ) )
+                            \n\t}}'''.format( index, cMaterial( slot ) ) )
 
-        self.dump += '\n}'
+        dump.write( '\n}' )
+        self.dump = dump.getvalue()
 
     def __repr__( self ):
         return self.dump
@@ -193,10 +201,12 @@ class cSubMaterials:
 
         if ( len( material_list ) > 1 ):
             # Build SubMaterials
+            matDump = io.StringIO()
             for index, slot in enumerate( material_list ):
-                self.matDump += '''\n\t\t*SUBMATERIAL {0} {{\
+                matDump.write( '''\n\t\t*SUBMATERIAL {0} {{\
                                 {1}\
-                                \n\t\t}}'''.format( index, cMaterial( slot ) )
+                                \n\t\t}}'''.format( index, cMaterial( slot ) ) )
+            self.matDump = matDump.getvalue()
 
         self.dump += '''\n\t\t*MATERIAL_NAME "{0}"\
                        \n\t\t*MATERIAL_CLASS "{1}"\
@@ -458,7 +468,7 @@ class cMesh:
             self.uvLayerNames.append( str( uv ) )
 
     def uvdump( self, object ):
-        self.mappingchannels = ''
+        mappingchannels = io.StringIO()
         # if there is more than 1 uv layer
         if collisionObject( object ) == False:
             self.getUVLayerNames( object )
@@ -495,12 +505,13 @@ class cMesh:
                     self.uvm_cfacelist = ''
 
                     # print extra mapping channels
-                    self.mappingchannels += '''\n\t\t*MESH_MAPPINGCHANNEL {0} {{\n\t\t\t*MESH_NUMTVERTEX {1}\n\t\t\t*MESH_TVERTLIST {2}\n\t\t*MESH_NUMTVFACES {3}\n\t\t*MESH_TFACELIST {4}{5}{6}{7}{8}\n\t\t}}'''.format( str( activeUV + 1 ), self.uvm_numtvertex, self.uvm_tvertlist, self.uvm_numtvfaces, self.uvm_tfacelist, self.uvm_numcvertex, self.uvm_cvertlist, self.uvm_numcvfaces, self.uvm_cfacelist )
+                    mappingchannels.write( '''\n\t\t*MESH_MAPPINGCHANNEL {0} {{\n\t\t\t*MESH_NUMTVERTEX {1}\n\t\t\t*MESH_TVERTLIST {2}\n\t\t*MESH_NUMTVFACES {3}\n\t\t*MESH_TFACELIST {4}{5}{6}{7}{8}\n\t\t}}'''.format( str( activeUV + 1 ), self.uvm_numtvertex, self.uvm_tvertlist, self.uvm_numtvfaces, self.uvm_tfacelist, self.uvm_numcvertex, self.uvm_cvertlist, self.uvm_numcvfaces, self.uvm_cfacelist ) )
                     activeUV = activeUV + 1
 
                 # restore uv actives
                 object.data.uv_textures.active_index = active_uv
 
+        self.mappingchannels = mappingchannels.getvalue()
         return self.mappingchannels
 
     # UV textures go AFTER MESH_FACE_LIST
@@ -510,27 +521,21 @@ class cMesh:
         return temp
 class cVertlist:
     def __init__( self, object ):
-        self.vertlist = []
-        for data in object.data.vertices:
-            temp = cVert( data.index, data.co.to_tuple( 4 ) )
-            self.vertlist.append( temp )
+        # Read the scale once for the whole mesh
+        scale = optionScale
+        self.vertlist = [cVert( data.index, data.co.to_tuple( 4 ), scale ) for data in object.data.vertices]
 
     def dump( self ):
-        temp = ''
-        for x in self.vertlist:
-            temp += str( x )
-        return temp
+        return ''.join( map( str, self.vertlist ) )
 
     def __repr__( self ):
         return '''{{\n{0}\t\t}}'''.format( self.dump() )
 class cVert:
-    def __init__( self, index, coord ):
-        global optionScale
-
+    def __init__( self, index, coord, scale ):
         self.index = index
-        self.x = aseFloat( coord[0] * optionScale )
-        self.y = aseFloat( coord[1] * optionScale )
-        self.z = aseFloat( coord[2] * optionScale )
+        self.x = aseFloat( coord[0] * scale )
+        self.y = aseFloat( coord[1] * scale )
+        self.z = aseFloat( coord[2] * scale )
 
     def __repr__( self ):
         return '''\t\t\t*MESH_VERTEX {0} {1} {2} {3}\n'''.format( self.index, self.x, self.y, self.z )
@@ -548,26 +553,30 @@ class cFacelist:
         if ( collisionObject( object ) == False ):
             if ( optionSmoothingGroups ):
                 self.smoothing_groups = defineSmoothing( self, object )
+                # Group of each face; a later group wins
+                face_group = {}
+                for index, group in enumerate( self.smoothing_groups ):
+                    for face_index in group:
+                        face_group[face_index] = index % 32
             else:
                 self.smoothing_groups = ''
 
+        # Material id of each slot, looked up once rather than per face
+        if optionAllowMultiMats and ( collisionObject( object ) == False ):
+            slotids = [matList.index( slot.material.name ) for slot in object.material_slots]
+
         for face in object.data.polygons:
             if optionAllowMultiMats:
                 if ( collisionObject( object ) == False ):
-                    self.matid = matList.index( object.material_slots[face.material_index].material.name )
+                    self.matid = slotids[face.material_index]
                 else:
                     self.matid = 0
             else:
                 self.matid = currentMatId
             if ( collisionObject( object ) == False ):
                 if ( optionSmoothingGroups ):
-                    for group in self.smoothing_groups:
-                        if group.count( face.index ) == 0:
-                            continue
-                        else:
-                            #TODO: Compress sg's
-                            index = self.smoothing_groups.index( group )
-                            sgID = index % 32
+                    #TODO: Compress sg's
+                    sgID = face_group.get( face.index, sgID )
 
             temp = '''\t\t\t*MESH_FACE {0}: A: {1} B: {2} C: {3} AB: 0 BC: 0 CA: 0 *MESH_SMOOTHING {4} *MESH_MTLID {5}\n'''.format( face.index, face.vertices[0], face.vertices[1], face.vertices[2], sgID, self.matid )
             self.facelist.append( temp )
@@ -579,10 +588,7 @@ class cFacelist:
         #currentMatId = matList.index( object.material_slots[0].material.name )
 
     def dump( self ):
-        temp = ''
-        for x in self.facelist:
-            temp = temp + str( x )
-        return temp
+        return ''.join( map( str, self.facelist ) )
 
     def __repr__( self ):
         return '''{{\n{0}\t\t}}'''.format( self.dump() )
@@ -609,10 +615,7 @@ class cTVertlist:
         self.length = len( self.vertlist )
 
     def dump( self ):
-        temp = ''
-        for x in self.vertlist:
-            temp += str( x )
-        return temp
+        return ''.join( map( str, self.vertlist ) )
 
     def __repr__( self ):
         return '''{{\n{0}\t\t}}'''.format( self.dump() )
@@ -626,29 +629,14 @@ class cTVert:
         return '''\t\t\t*MESH_TVERT {0} {1} {2} 0.0000\n'''.format( self.index, self.u, self.v )
 class cTFacelist:
     def __init__( self, facecount ):
-        self.facelist = []
-        for data in range( facecount ):
-            temp = cTFace( data )
-            self.facelist.append( temp )
+        # Each face uses three consecutive tverts
+        self.facelist = ['''\t\t\t*MESH_TFACE {0} {1} {2} {3}\n'''.format( x, x * 3, ( x * 3 ) + 1, ( x * 3 ) + 2 ) for x in range( facecount )]
 
     def dump( self ):
-        temp = ''
-        for x in self.facelist:
-            temp = temp + str( x )
-        return temp
+        return ''.join( self.facelist )
 
     def __repr__( self ):
         return '''{{\n{0}\t\t}}'''.format( self.dump() )
-class cTFace:
-    def __init__( self, x ):
-        self.index = x
-        self.vertices = []
-        self.vertices.append( x * 3 )
-        self.vertices.append( ( x * 3 ) + 1 )
-        self.vertices.append( ( x * 3 ) + 2 )
-
-    def __repr__( self ):
-        return '''\t\t\t*MESH_TFACE {0} {1} {2} {3}\n'''.format( self.index, self.vertices[0], self.vertices[1], self.vertices[2] )
 class cCVertlist:
     def __init__( self, object ):
         self.vertlist = []
@@ -670,10 +658,7 @@ class cCVertlist:
         self.length = len( self.vertlist )
 
     def dump( self ):
-        temp = ''
-        for x in self.vertlist:
-            temp = temp + str( x )
-        return temp
+        return ''.join( map( str, self.vertlist ) )
 
     def __repr__( self ):
         return '''\t\t*MESH_CVERTLIST {{\n{0}\t\t}}'''.format( self.dump() )
@@ -688,53 +673,29 @@ class cCVert:
         return '''\t\t\t*MESH_VERTCOL {0} {1} {2} {3}\n'''.format( self.index, self.r, self.g, self.b )
 class cCFacelist:
     def __init__( self, facecount ):
-        temp = [0 for x in range( facecount )]
-        self.facelist = []
-        for index, data in enumerate( temp ):
-            self.facelist.append( cCFace( index, data ) )
+        # Each face uses three consecutive cverts
+        self.facelist = ['''\t\t\t*MESH_CFACE {0} {1} {2} {3}\n'''.format( x, x * 3, ( x * 3 ) + 1, ( x * 3 ) + 2 ) for x in range( facecount )]
 
     def dump( self ):
-        temp = ''
-        for x in self.facelist:
-            temp = temp + str( x )
-        return temp
+        return ''.join( self.facelist )
 
     def __repr__( self ):
         return '''\t\t*MESH_CFACELIST {{\n{0}\t\t}}'''.format( self.dump() )
-class cCFace:
-    def __init__( self, index, data ):
-        self.index = index
-        self.vertices = []
-        self.vertices.append( index * 3 )
-        self.vertices.append( ( index * 3 ) + 1 )
-        self.vertices.append( ( index * 3 ) + 2 )
-
-    def __repr__( self ):
-        return '''\t\t\t*MESH_CFACE {0} {1} {2} {3}\n'''.format( self.index, self.vertices[0], self.vertices[1], self.vertices[2] )
 class cNormallist:
     def __init__( self, object ):
+        # Each vertex normal is formatted once, however many faces share it
+        vertnormals = [[aseFloat( y ) for y in vert.normal.to_tuple( 4 )] for vert in object.data.vertices]
         self.normallist = []
         for face in object.data.polygons:
-            self.normallist.append( cNormal( face, object ) )
+            facenormal = [aseFloat( x ) for x in face.normal.to_tuple( 4 )]
+            a, b, c = face.vertices[0], face.vertices[1], face.vertices[2]
+            self.normallist.append( '''\t\t\t*MESH_FACENORMAL {0} {1} {2} {3}\n\t\t\t\t*MESH_VERTEXNORMAL {4} {5} {6} {7}\n\t\t\t\t*MESH_VERTEXNORMAL {8} {9} {10} {11}\n\t\t\t\t*MESH_VERTEXNORMAL {12} {13} {14} {15}\n'''.format( face.index, facenormal[0], facenormal[1], facenormal[2], a, vertnormals[a][0], vertnormals[a][1], vertnormals[a][2], b, vertnormals[b][0], vertnormals[b][1], vertnormals[b][2], c, vertnormals[c][0], vertnormals[c][1], vertnormals[c][2] ) )
 
     def dump( self ):
-        temp = ''
-        for x in self.normallist:
-            temp = temp + str( x )
-        return temp
+        return ''.join( self.normallist )
 
     def __repr__( self ):
         return '''\t\t*MESH_NORMALS {{\n{0}\t\t}}'''.format( self.dump() )
-class cNormal:
-    def __init__( self, face, object ):
-        self.faceindex = face.index
-        self.facenormal = [aseFloat( x ) for x in face.normal.to_tuple( 4 )]
-        self.vertnormals = []
-        for x in face.vertices:
-            self.vertnormals.append( [x, [aseFloat( y ) for y in object.data.vertices[x].normal.to_tuple( 4 )]] )
-
-    def __repr__( self ):
-        return '''\t\t\t*MESH_FACENORMAL {0} {1} {2} {3}\n\t\t\t\t*MESH_VERTEXNORMAL {4} {5} {6} {7}\n\t\t\t\t*MESH_VERTEXNORMAL {8} {9} {10} {11}\n\t\t\t\t*MESH_VERTEXNORMAL {12} {13} {14} {15}\n'''.format( self.faceindex, self.facenormal[0], self.facenormal[1], self.facenormal[2], self.vertnormals[0][0], self.vertnormals[0][1][0], self.vertnormals[0][1][1], self.vertnormals[0][1][2], self.vertnormals[1][0], self.vertnormals[1][1][0], self.vertnormals[1][1][1], self.vertnormals[1][1][2], self.vertnormals[2][0], self.vertnormals[2][1][0], self.vertnormals[2][1][1], self.vertnormals[2][1][2] )
 
 #== Smoothing Groups and Helper Methods =================================
 def defineSmoothing( self, object ):
@@ -777,26 +738,27 @@ def defineSmoothing( self, object ):
     bpy.ops.mesh.select_all( action = 'DESELECT' )
 
     smoothing_groups = []
-    face_list = []
 
     mode = getSelMode( self, False )
     setSelMode( 'FACE' )
 
-    for face in object.data.polygons:
-        face_list.append( face.index )
+    # Faces already in a group; the next group starts at the lowest index left
+    grouped = set()
+    first = 0
+    numfaces = len( object.data.polygons )
 
-    while len( face_list ) > 0:
+    while first < numfaces:
         bpy.ops.object.mode_set( mode = 'OBJECT' )
-        object.data.polygons[face_list[0]].select = True
+        object.data.polygons[first].select = True
         bpy.ops.object.mode_set( mode = 'EDIT' )
         bpy.ops.mesh.select_linked( limit = True )
 
         # TODO - update when API is updated
         selected_faces = getSelectedFaces( self, True )
         smoothing_groups.append( selected_faces )
-        for face_index in selected_faces:
-            if face_list.count( face_index ) > 0:
-                face_list.remove( face_index )
+        grouped.update( selected_faces )
+        while first < numfaces and first in grouped:
+            first += 1
         bpy.ops.mesh.select_all( action = 'DESELECT' )
 
     setSelMode( mode, False )
@@ -827,6 +789,15 @@ def defineSmoothing( self, object ):
 # // General Helpers
 #===========================================================================
 
+# Move src onto dst, replacing it; os.replace needs Python 3.3+
+def replaceFile( src, dst ):
+    if hasattr( os, 'replace' ):
+        os.replace( src, dst )
+    else:
+        if os.path.exists( dst ):
+            os.remove( dst )
+        os.rename( src, dst )
+
 # Check if the mesh is a collider
 # Return True if collision model, else: false
 def collisionObject( object ):
@@ -1005,15 +976,13 @@ class ExportAse( bpy.types.Operator, ExportHelper ):
         ok = selected or camera
         return ok
 
-    def writeASE( self, filename, data ):
+    def openASE( self, filename ):
         print( '\nWriting', filename )
         try:
-            file = open( filename, 'w' )
+            return open( filename, 'wb', buffering = 1 << 20 )
         except IOError:
             print( 'Error: The file could not be written to. Aborting.' )
-        else:
-            file.write( data )
-            file.close()
+            return None
 
     def execute( self, context ):
         start = time.clock()
@@ -1026,7 +995,6 @@ class ExportAse( bpy.types.Operator, ExportHelper ):
         global aseHeader
         global aseScene
         global aseMaterials
-        global aseGeometry
 
         global currentMatId
         global numMats
@@ -1036,7 +1004,6 @@ class ExportAse( bpy.types.Operator, ExportHelper ):
         aseHeader = ''
         aseScene = ''
         aseMaterials = ''
-        aseGeometry = ''
 
         optionScale = self.option_scale
         optionSubmaterials = self.option_submaterials
@@ -1054,27 +1021,56 @@ class ExportAse( bpy.types.Operator, ExportHelper ):
         aseScene = str( cScene() )
         aseMaterials = str( cMaterials() )
 
+        # Stream geometry objects into a single file as they are built
+        if (self.option_separate):
+            self.writeGeometry( context, None )
+        else:
+            # Write to a temp file so a failed export keeps any previous file
+            tempname = self.filepath + '.tmp'
+            file = self.openASE( tempname )
+            if file is None:
+                return {'CANCELLED'}
+            try:
+                file.write( aseHeader.encode() )
+                file.write( aseScene.encode() )
+                file.write( aseMaterials.encode() )
+                self.writeGeometry( context, file )
+            except Exception:
+                file.close()
+                os.remove( tempname )
+                raise
+            file.close()
+            replaceFile( tempname, self.filepath )
+
+        lapse = ( time.clock() - start )
+        print( 'Completed in ' + str( lapse ) + ' seconds' )
+
+        return {'FINISHED'}
+
+    def writeGeometry( self, context, file ):
+        # Folder every separate ASE file is written to
+        folder = os.path.dirname( self.filepath ) + os.sep
+
         # Apply applicable options
         for object in bpy.context.selected_objects:
             if object.type == 'MESH':
                 bpy.context.scene.objects.active = object
                 object.select = True
 
-                # Options
-                bpy.ops.object.mode_set( mode = 'EDIT' )
-                if self.option_remove_doubles:
+                # Options; none of them changes the selection, so select once.
+                # This edits the user's own mesh, so leave its selection alone
+                # when no option needs it
+                if self.option_remove_doubles or self.option_triangulate or self.option_normals:
                     bpy.ops.object.mode_set( mode = 'EDIT' )
                     bpy.ops.mesh.select_all( action = 'SELECT' )
-                    bpy.ops.mesh.remove_doubles()
-                if self.option_triangulate:
-                    print( object.name + ': Converting to triangles' )
-                    bpy.ops.mesh.select_all( action = 'SELECT' )
-                    bpy.ops.mesh.quads_convert_to_tris()
-                if self.option_normals:
-                    print( object.name + ': Recalculating normals' )
-                    bpy.ops.object.mode_set( mode = 'EDIT' )
-                    bpy.ops.mesh.select_all( action = 'SELECT' )
-                    bpy.ops.mesh.normals_make_consistent()
+                    if self.option_remove_doubles:
+                        bpy.ops.mesh.remove_doubles()
+                    if self.option_triangulate:
+                        print( object.name + ': Converting to triangles' )
+                        bpy.ops.mesh.quads_convert_to_tris()
+                    if self.option_normals:
+                        print( object.name + ': Recalculating normals' )
+                        bpy.ops.mesh.normals_make_consistent()
 
                 # Transformations
                 bpy.ops.object.mode_set( mode = 'OBJECT' )
@@ -1082,88 +1078,81 @@ class ExportAse( bpy.types.Operator, ExportHelper ):
 
                 #Construct ASE Geometry Nodes
                 
-                aseGeom = ''
-                #Copy object by creating a new mesh from it, applying modifiers
-				
-                if (self.option_copy):
-                    orig_mesh = object.data
-                    meshes = [bpy.data.meshes.new_from_object(context.scene, object, True, 'PREVIEW')]
-
-                    if self.option_split:
-                        import bmesh
-
-                        object.data = meshes[0]
-                        bpy.ops.object.mode_set(mode = 'EDIT')
-                        meshes = []
-
-                        bm = bmesh.from_edit_mesh(object.data)
-                        for midx, mslot in enumerate(object.material_slots):
-                            mat = mslot.material
-                            if mat:
-                                bm_new = bm.copy()
-                                faces = None
-                                for f in bm_new.faces:
-                                    if f.material_index == midx:
-                                        # type=201 = material
-                                        faces = set(bmesh.ops.similar_faces(bm_new, faces=[f], type=201)['faces'])
-                                        faces = [f for f in bm_new.faces if f not in faces]
-                                        break
-                                if faces:
-                                    for f in faces:
-                                        bm_new.faces.remove(f)
-                                    new_mesh = orig_mesh.copy()
-                                    bm_new.to_mesh(new_mesh)
-                                    meshes.append(new_mesh)
-
-                        bpy.ops.object.mode_set(mode = 'OBJECT')
-                        old_mesh = object.data
-                        object.data = orig_mesh
-                        bpy.data.meshes.remove(old_mesh)
-
-                    for mesh in meshes:
-                        object.data = mesh
-                        aseGeom += str(cGeomObject(object))
-
-                    object.data = orig_mesh
-                    for mesh in meshes:
-                        bpy.data.meshes.remove(mesh)
-                else:
-                    aseGeom = str( cGeomObject( object ) )
-                
                 if (self.option_separate):
-                    aseModel = ''
-                    aseModel += aseHeader
-                    aseModel += aseScene
-                    aseModel += aseMaterials
-                    aseModel += aseGeom
-
-                    # Write the ASE file
-                    filename = os.path.dirname(self.filepath)
-                    filename += (os.sep + object.name.replace('.', '_'))
-                    filename += ".ase"
-                    self.writeASE(filename, aseModel )
+                    # Each object gets its own ASE file, written to a temp file
+                    # first so a failing object leaves nothing half written
+                    filename = folder + object.name.translate( fileNameChars ) + ".ase"
+                    tempname = filename + '.tmp'
+                    out = self.openASE( tempname )
+                    if out is None:
+                        continue
+                    try:
+                        out.write( aseHeader.encode() )
+                        out.write( aseScene.encode() )
+                        out.write( aseMaterials.encode() )
+                        self.writeObject( context, object, out )
+                    except Exception:
+                        out.close()
+                        os.remove( tempname )
+                        raise
+                    out.close()
+                    replaceFile( tempname, filename )
                 else:
-                    aseGeometry += aseGeom 
+                    self.writeObject( context, object, file )
                  
 
             else:
                 continue
 
-        if (self.option_separate == False):
-            aseModel = ''
-            aseModel += aseHeader
-            aseModel += aseScene
-            aseModel += aseMaterials
-            aseModel += aseGeometry
-
-            # Write the ASE file
-            self.writeASE( self.filepath, aseModel )
-        
-
-        lapse = ( time.clock() - start )
-        print( 'Completed in ' + str( lapse ) + ' seconds' )
-
-        return {'FINISHED'}
+    # Write the GEOMOBJECT(s) of one object to file
+    def writeObject( self, context, object, file ):
+        #Copy object by creating a new mesh from it, applying modifiers
+				
+        if (self.option_copy):
+            orig_mesh = object.data
+            meshes = [bpy.data.meshes.new_from_object(context.scene, object, True, 'PREVIEW')]
+
+            if self.option_split:
+                import bmesh
+
+                object.data = meshes[0]
+                bpy.ops.object.mode_set(mode = 'EDIT')
+                meshes = []
+
+                bm = bmesh.from_edit_mesh(object.data)
+                # Only slots that some face uses get a mesh
+                used = set(f.material_index for f in bm.faces)
+                for midx, mslot in enumerate(object.material_slots):
+                    mat = mslot.material
+                    if mat and midx in used:
+                        bm_new = bm.copy()
+                        faces = [f for f in bm_new.faces if f.material_index != midx]
+                        for f in faces:
+                            bm_new.faces.remove(f)
+                        new_mesh = orig_mesh.copy()
+                        bm_new.to_mesh(new_mesh)
+                        bm_new.free()
+                        meshes.append(new_mesh)
+
+                bpy.ops.object.mode_set(mode = 'OBJECT')
+                old_mesh = object.data
+                object.data = orig_mesh
+                bpy.data.meshes.remove(old_mesh)
+
+            # Write each chunk and drop its mesh before building the next;
+            # if one fails, still restore the object's mesh and drop the rest
+            try:
+                while meshes:
+                    object.data = meshes[0]
+                    file.write( str( cGeomObject( object ) ).encode() )
+                    object.data = orig_mesh
+                    bpy.data.meshes.remove(meshes.pop(0))
+            finally:
+                object.data = orig_mesh
+                for mesh in meshes:
+                    bpy.data.meshes.remove(mesh)
+        else:
+            file.write( str( cGeomObject( object ) ).encode() )
 
 def menu_func( self, context ):
     self.layout.operator( ExportAse.bl_idname, text = "Ascii Scene Exporter (.ase) v2.5.8" )
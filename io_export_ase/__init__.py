@@ -44,14 +44,18 @@ bl_info = {
 --  UDK Thread at http://forums.epicgames.com/threads/776986-Blender-2-57-ASE-export
 """
 
+import io
 import os
 import bpy
+import bmesh
 import math
 import time
-from bpy_extras import node_shader_utils
+import numpy as np
 
 # settings
-aseFloat = lambda x: '''{0: 0.4f}'''.format( x )
+aseFloat = '''% 0.4f'''.__mod__
+# Black/zero colour, as three formatted floats
+aseZeros = aseFloat( 0.0 ) * 3
 optionScale = 1.0
 optionSubmaterials = False
 optionSmoothingGroups = True
@@ -61,13 +65,15 @@ optionAllowMultiMats = True
 aseHeader = ''
 aseScene = ''
 aseMaterials = ''
-aseGeometry = ''
 
 # Other
 matList = []
+matIndex = {}
 numMats = 0
 currentMatId = 0
 list_objects = []
+principledNodes = {}
+diffuseMaps = {}
 
 
 
@@ -96,8 +102,8 @@ class cScene:
         self.lastframe = 100
         self.framespeed = 30
         self.ticksperframe = 160
-        self.backgroundstatic = ''.join( [aseFloat( x ) for x in [0.0, 0.0, 0.0]] )
-        self.ambientstatic = ''.join( [aseFloat( x ) for x in [0.0, 0.0, 0.0]] )
+        self.backgroundstatic = aseZeros
+        self.ambientstatic = aseZeros
 
     def __repr__( self ):
         return '''*SCENE {{\n\t*SCENE_FILENAME "{0}"\
@@ -115,6 +121,7 @@ class cMaterials:
     def __init__( self ):
         global optionSubmaterials
         global matList
+        global matIndex
         global numMats
 
         import bpy
@@ -133,10 +140,9 @@ class cMaterials:
                 print( object.name + ': Constructing Materials' )
                 for slot in object.material_slots:
                     # if the material is not in the material_list, add it
-                    if self.material_list.count( slot.material ) == 0:
+                    if slot.material.name not in matIndex:
+                        matIndex[slot.material.name] = len( matList )
                         self.material_list.append( slot.material )
-                        mat_wrap = node_shader_utils.PrincipledBSDFWrapper(slot.material) if slot.material else None
-                        # image = mat_wrap.base_color_texture.image
                         matList.append( slot.material.name )
 
                     bpy.context.view_layer.objects.active = object
@@ -160,16 +166,18 @@ class cMultiMaterials:
     def __init__( self, material_list ):
         self.numMtls = len( material_list )
         # Initialize material information
-        self.dump = '''*MATERIAL_LIST {{\
+        dump = io.StringIO()
+        dump.write( '''*MATERIAL_LIST {{\
                     \n\t*MATERIAL_COUNT {0}\
-                    '''.format( str( self.numMtls ) )
+                    '''.format( str( self.numMtls ) ) )
 
         for index, slot in enumerate( material_list ):
-            self.dump += '''\n\t*MATERIAL {0} {{\
+            dump.write( '''\n\t*MATERIAL {0} {{\
                             {1}\
-                            \n\t}}'''.format( index, cMaterial( slot ) )
+                            \n\t}}'''.format( index, cMaterial( slot ) ) )
 
-        self.dump += '\n}'
+        dump.write( '\n}' )
+        self.dump = dump.getvalue()
 
     def __repr__( self ):
         return self.dump
@@ -181,8 +189,7 @@ class cSubMaterials:
 
         # Get BSDF inputs
         material = bpy.data.materials[slot.name]
-        nodes = material.node_tree.nodes
-        principled = next(n for n in nodes if n.type == 'BSDF_PRINCIPLED')
+        principled = findPrincipled( material )
         inputVal = principled.inputs['Specular']
         base_color = principled.inputs['Base Color']  # Or principled.inputs[0]
         value = base_color.default_value
@@ -197,7 +204,7 @@ class cSubMaterials:
         self.matDump = ''
         self.name = material_list[0].name
         self.numSubMtls = len( material_list )
-        self.diffusemap = cDiffusemap( slot ) # /*slot.texture_slots[0]*/
+        self.diffusemap = diffuseMap( slot ) # /*slot.texture_slots[0]*/
         if ( self.numSubMtls > 1 ):
             self.matClass = 'Multi/Sub-Object'
             self.diffuseDump = ''
@@ -205,9 +212,9 @@ class cSubMaterials:
             self.matClass = 'Standard'
             self.numSubMtls = 0
             self.diffuseDump = self.diffdump()
-        self.ambient = ''.join( [aseFloat( x ) for x in [0.0, 0.0, 0.0]] )
+        self.ambient = aseZeros
         self.diffuse = ''.join([aseFloat(x) for x in color])
-        self.specular = ''.join([aseFloat(x) for x in [inputVal.default_value, inputVal.default_value, inputVal.default_value]])
+        self.specular = aseFloat( inputVal.default_value ) * 3
         self.shine = aseFloat(valRough.default_value)  # slot.specular_hardness / 511
         self.shinestrength = aseFloat( 0 )
         self.transparency = aseFloat( 0 )
@@ -222,10 +229,12 @@ class cSubMaterials:
 
         if ( len( material_list ) > 1 ):
             # Build SubMaterials
+            matDump = io.StringIO()
             for index, slot in enumerate( material_list ):
-                self.matDump += '''\n\t\t*SUBMATERIAL {0} {{\
+                matDump.write( '''\n\t\t*SUBMATERIAL {0} {{\
                                 {1}\
-                                \n\t\t}}'''.format( index, cMaterial( slot ) )
+                                \n\t\t}}'''.format( index, cMaterial( slot ) ) )
+            self.matDump = matDump.getvalue()
 
         self.dump += '''\n\t\t*MATERIAL_NAME "{0}"\
                        \n\t\t*MATERIAL_CLASS "{1}"\
@@ -255,56 +264,40 @@ class cSubMaterials:
     def __repr__( self ):
         return self.dump
 class cMaterial:
+    # Only the name, colours, shine and diffuse map differ between materials
+    template = '''\n\t\t*MATERIAL_NAME "{name}"\
+                       \n\t\t*MATERIAL_CLASS "Standard"\
+                       \n\t\t*MATERIAL_AMBIENT  0.0000 0.0000 0.0000\
+                       \n\t\t*MATERIAL_DIFFUSE {diffuse}\
+                       \n\t\t*MATERIAL_SPECULAR {specular}\
+                       \n\t\t*MATERIAL_SHINE {shine}\
+                       \n\t\t*MATERIAL_SHINESTRENGTH  0.0000\
+                       \n\t\t*MATERIAL_TRANSPARENCY  1.0000\
+                       \n\t\t*MATERIAL_WIRESIZE  1.0000\
+                       \n\t\t*MATERIAL_SHADING WHO CARES\
+                       \n\t\t*MATERIAL_XP_FALLOFF  0.0000\
+                       \n\t\t*MATERIAL_SELFILLUM  0.0000\
+                       \n\t\t*MATERIAL_FALLOFF In\
+                       \n\t\t*MATERIAL_XP_TYPE Filter\
+                       {diffusemap}\
+                       '''
+
     def __init__( self, slot ):
-        import bpy
         from mathutils import Color
-        self.dump = ''
-        obj = bpy.context.object
         material = bpy.data.materials[slot.name]
-        nodes = material.node_tree.nodes
-        principled = next(n for n in nodes if n.type == 'BSDF_PRINCIPLED')
+        principled = findPrincipled( material )
         inputVal= principled.inputs['Specular'] # or .inputs[5]
         base_color = principled.inputs['Base Color']  # Or principled.inputs[0] get base color
         value = base_color.default_value
         color = Color((value[0], value[1], value[2]))
         valRough = principled.inputs['Roughness']  # Or principled.inputs[7]
 
-
         self.name = slot.name
-        self.matClass = 'Standard'
-        self.ambient = ''.join( [aseFloat( x ) for x in [0.0, 0.0, 0.0]] )
         self.diffuse = ''.join( [aseFloat( x ) for x in color] )
-        self.specular = ''.join( [aseFloat( x ) for x in [inputVal.default_value, inputVal.default_value, inputVal.default_value ]] )
+        self.specular = aseFloat( inputVal.default_value ) * 3
         self.shine = aseFloat( valRough.default_value )  # slot.specular_hardness / 511
-        self.shinestrength = aseFloat( 0.0 )  # slot.specular_intensity
-        self.transparency = aseFloat( 1.0 ) #aseFloat( 0.0 )  # slot.translucency * slot.alpha
-        self.wiresize = aseFloat( 1.0 )
-
-        # Material Definition
-        self.shading = 'WHO CARES'  # str( slot.specular_shader ).capitalize()
-        self.xpfalloff = aseFloat( 0.0 )
-        self.xptype = 'Filter'
-        self.falloff = 'In'
-        self.soften = False
-        self.diffusemap = cDiffusemap( slot )  # slot.texture_slots[0]
-        self.submtls = []
-        self.selfillum = aseFloat( 0.0 )
-        self.dump = '''\n\t\t*MATERIAL_NAME "{0}"\
-                       \n\t\t*MATERIAL_CLASS "{1}"\
-                       \n\t\t*MATERIAL_AMBIENT {2}\
-                       \n\t\t*MATERIAL_DIFFUSE {3}\
-                       \n\t\t*MATERIAL_SPECULAR {4}\
-                       \n\t\t*MATERIAL_SHINE {5}\
-                       \n\t\t*MATERIAL_SHINESTRENGTH {6}\
-                       \n\t\t*MATERIAL_TRANSPARENCY {7}\
-                       \n\t\t*MATERIAL_WIRESIZE {8}\
-                       \n\t\t*MATERIAL_SHADING {9}\
-                       \n\t\t*MATERIAL_XP_FALLOFF {10}\
-                       \n\t\t*MATERIAL_SELFILLUM {11}\
-                       \n\t\t*MATERIAL_FALLOFF {12}\
-                       \n\t\t*MATERIAL_XP_TYPE {13}\
-                       {14}\
-                       '''.format( self.name, self.matClass, self.ambient, self.diffuse, self.specular, self.shine, self.shinestrength, self.transparency, self.wiresize, self.shading, self.xpfalloff, self.selfillum, self.falloff, self.xptype, self.diffdump() )
+        self.diffusemap = diffuseMap( slot )  # slot.texture_slots[0]
+        self.dump = self.template.format( name = self.name, diffuse = self.diffuse, specular = self.specular, shine = self.shine, diffusemap = self.diffdump() )
 
     def diffdump( self ):
         for x in [self.diffusemap]:
@@ -313,6 +306,29 @@ class cMaterial:
     def __repr__( self ):
         return self.dump
 class cDiffusemap:
+    # Only the map name and bitmap path differ between materials
+    template = '''\n\t\t*MAP_DIFFUSE {{\
+                       \n\t\t\t*MAP_NAME "{name}"\
+                       \n\t\t\t*MAP_CLASS "Bitmap"\
+                       \n\t\t\t*MAP_SUBNO 1\
+                       \n\t\t\t*MAP_AMOUNT  1.0000\
+                       \n\t\t\t*BITMAP "{bitmap}"\
+                       \n\t\t\t*MAP_TYPE Screen\
+                       \n\t\t\t*UVW_U_OFFSET  0.0000\
+                       \n\t\t\t*UVW_V_OFFSET  0.0000\
+                       \n\t\t\t*UVW_U_TILING  1.0000\
+                       \n\t\t\t*UVW_V_TILING  1.0000\
+                       \n\t\t\t*UVW_ANGLE  0.0000\
+                       \n\t\t\t*UVW_BLUR  1.0000\
+                       \n\t\t\t*UVW_BLUR_OFFSET  0.0000\
+                       \n\t\t\t*UVW_NOUSE_AMT  1.0000\
+                       \n\t\t\t*UVW_NOISE_SIZE  1.0000\
+                       \n\t\t\t*UVW_NOISE_LEVEL 1\
+                       \n\t\t\t*UVW_NOISE_PHASE  0.0000\
+                       \n\t\t\t*BITMAP_FILTER Pyramidal\
+                       \n\t\t}}\
+                       '''
+
     def __init__( self, slot ):
         import os
         import bpy
@@ -320,13 +336,11 @@ class cDiffusemap:
 
         if slot is None:
            self.name = 'default'
-           self.mapclass = 'Bitmap'
            self.bitmap = 'None'
         else:
         # RS mod - Get texture images from slot nodes
            material = bpy.data.materials[slot.name]
-           nodes = material.node_tree.nodes
-           principled = next(n for n in nodes if n.type == 'BSDF_PRINCIPLED')
+           principled = findPrincipled( material )
            base_color = principled.inputs['Base Color']
            if base_color.is_linked:
                link = base_color.links[0]
@@ -341,47 +355,10 @@ class cDiffusemap:
                raise TypeError(' Get one image texture from a file and assign it')
 
            self.name = link_node.image.name
-           self.mapclass = 'Bitmap'
            #self.bitmap = bpy.path.abspath(link_node.image.filepath)
            self.bitmap = '\\\\base\\' + slot.name.replace( '/', '\\' )
 
-        self.subno = 1
-        self.amount = aseFloat(1.0)
-        self.type = 'Screen'
-        self.uoffset = aseFloat(0.0)
-        self.voffset = aseFloat(0.0)
-        self.utiling = aseFloat(1.0)
-        self.vtiling = aseFloat(1.0)
-        self.angle = aseFloat(0.0)
-        self.blur = aseFloat(1.0)
-        self.bluroffset = aseFloat(0.0)
-        self.noiseamt = aseFloat(1.0)
-        self.noisesize = aseFloat(1.0)
-        self.noiselevel = 1
-        self.noisephase = aseFloat(0.0)
-        self.bitmapfilter = 'Pyramidal'
-
-        self.dump = '''\n\t\t*MAP_DIFFUSE {{\
-                       \n\t\t\t*MAP_NAME "{0}"\
-                       \n\t\t\t*MAP_CLASS "{1}"\
-                       \n\t\t\t*MAP_SUBNO {2}\
-                       \n\t\t\t*MAP_AMOUNT {3}\
-                       \n\t\t\t*BITMAP "{4}"\
-                       \n\t\t\t*MAP_TYPE {5}\
-                       \n\t\t\t*UVW_U_OFFSET {6}\
-                       \n\t\t\t*UVW_V_OFFSET {7}\
-                       \n\t\t\t*UVW_U_TILING {8}\
-                       \n\t\t\t*UVW_V_TILING {9}\
-                       \n\t\t\t*UVW_ANGLE {10}\
-                       \n\t\t\t*UVW_BLUR {11}\
-                       \n\t\t\t*UVW_BLUR_OFFSET {12}\
-                       \n\t\t\t*UVW_NOUSE_AMT {13}\
-                       \n\t\t\t*UVW_NOISE_SIZE {14}\
-                       \n\t\t\t*UVW_NOISE_LEVEL {15}\
-                       \n\t\t\t*UVW_NOISE_PHASE {16}\
-                       \n\t\t\t*BITMAP_FILTER {17}\
-                       \n\t\t}}\
-                       '''.format(self.name, self.mapclass, self.subno, self.amount, self.bitmap, self.type, self.uoffset, self.voffset, self.utiling, self.vtiling, self.angle, self.blur, self.bluroffset, self.noiseamt, self.noisesize, self.noiselevel, self.noisephase, self.bitmapfilter)
+        self.dump = self.template.format( name = self.name, bitmap = self.bitmap )
 
     def __repr__( self ):
         return self.dump
@@ -404,58 +381,64 @@ class cGeomObject:
             self.material_ref = currentMatId
 
         self.nodetm = cNodeTM( object )
-        self.mesh = cMesh( object )
+        # Checked once here and handed down to every list that needs it
+        self.mesh = cMesh( object, collisionObject( object ) )
 
-        self.dump = '''\n*GEOMOBJECT {{\n\t*NODE_NAME "{0}"\n{1}\n{2}\n\t*PROP_MOTIONBLUR {3}\n\t*PROP_CASTSHADOW {4}\n\t*PROP_RECVSHADOW {5}\n\t*MATERIAL_REF {6}\n}}'''.format( self.name, self.nodetm, self.mesh, self.prop_motionblur, self.prop_castshadow, self.prop_recvshadow, self.material_ref )
+    # Write each part straight to the file rather than nesting them in one string
+    def write( self, file ):
+        file.write( '''\n*GEOMOBJECT {{\n\t*NODE_NAME "{0}"\n{1}\n'''.format( self.name, self.nodetm ).encode() )
+        self.mesh.write( file )
+        file.write( '''\n\t*PROP_MOTIONBLUR {0}\n\t*PROP_CASTSHADOW {1}\n\t*PROP_RECVSHADOW {2}\n\t*MATERIAL_REF {3}\n}}'''.format( self.prop_motionblur, self.prop_castshadow, self.prop_recvshadow, self.material_ref ).encode() )
 
     def __repr__( self ):
-        return self.dump
+        buf = io.BytesIO()
+        self.write( buf )
+        return buf.getvalue().decode()
 class cNodeTM:
+    # Transforms are applied before export, so everything after NODE_NAME
+    # is the same identity block for every object
+    tail = '''\
+                       \n\t\t*INHERIT_POS 0 0 0\
+                       \n\t\t*INHERIT_ROT 0 0 0\
+                       \n\t\t*INHERIT_SCL 0 0 0\
+                       \n\t\t*TM_ROW0 1.0000 0.0000 0.0000\
+                       \n\t\t*TM_ROW1 0.0000 1.0000 0.0000\
+                       \n\t\t*TM_ROW2 0.0000 0.0000 1.0000\
+                       \n\t\t*TM_ROW3 0.0000 0.0000 0.0000\
+                       \n\t\t*TM_POS 0.0000 0.0000 0.0000\
+                       \n\t\t*TM_ROTAXIS 0.0000 0.0000 0.0000\
+                       \n\t\t*TM_ROTANGLE 0.0000\
+                       \n\t\t*TM_SCALE 1.0000 1.0000 1.0000\
+                       \n\t\t*TM_SCALEAXIS 0.0000 0.0000 0.0000\
+                       \n\t\t*TM_SCALEAXISANG 0.0000\
+                       \n\t}'''
+
     def __init__( self, object ):
         self.name = object.name
-        self.inherit_pos = '0 0 0'
-        self.inherit_rot = '0 0 0'
-        self.inherit_scl = '0 0 0'
-        self.tm_row0 = '1.0000 0.0000 0.0000'
-        self.tm_row1 = '0.0000 1.0000 0.0000'
-        self.tm_row2 = '0.0000 0.0000 1.0000'
-        self.tm_row3 = '0.0000 0.0000 0.0000'
-        self.tm_pos = '0.0000 0.0000 0.0000'
-        self.tm_rotaxis = '0.0000 0.0000 0.0000'
-        self.tm_rotangle = '0.0000'
-        self.tm_scale = '1.0000 1.0000 1.0000'
-        self.tm_scaleaxis = '0.0000 0.0000 0.0000'
-        self.tm_scaleaxisang = '0.0000'
-
         self.dump = '''\t*NODE_TM {{\
-                       \n\t\t*NODE_NAME "{0}"\
-                       \n\t\t*INHERIT_POS {1}\
-                       \n\t\t*INHERIT_ROT {2}\
-                       \n\t\t*INHERIT_SCL {3}\
-                       \n\t\t*TM_ROW0 {4}\
-                       \n\t\t*TM_ROW1 {5}\
-                       \n\t\t*TM_ROW2 {6}\
-                       \n\t\t*TM_ROW3 {7}\
-                       \n\t\t*TM_POS {8}\
-                       \n\t\t*TM_ROTAXIS {9}\
-                       \n\t\t*TM_ROTANGLE {10}\
-                       \n\t\t*TM_SCALE {11}\
-                       \n\t\t*TM_SCALEAXIS {12}\
-                       \n\t\t*TM_SCALEAXISANG {13}\
-                       \n\t}}'''.format( self.name, self.inherit_pos, self.inherit_rot, self.inherit_scl, self.tm_row0, self.tm_row1, self.tm_row2, self.tm_row3, self.tm_pos, self.tm_rotaxis, self.tm_rotangle, self.tm_scale, self.tm_scaleaxis, self.tm_scaleaxisang )
+                       \n\t\t*NODE_NAME "{0}"{1}'''.format( self.name, self.tail )
 
     def __repr__( self ):
         return self.dump
 class cMesh:
-    def __init__( self, object ):
+    def __init__( self, object, collision ):
         bpy.ops.mesh.reveal
+        self.collision = collision
+
+        # update tessface once for every list built below
+        object.data.update()
+        object.data.calc_loop_triangles()
+        self.triloops, self.triverts, self.tripolys = loopTriangles( object.data )
 
-        if collisionObject( object ) == False:
-            object.data.uv_layers.active_index = 0
-            object.data.uv_layer_stencil_index = 0
-            self.tvertlist = cTVertlist( object )
+        if not collision:
+            # Only one UV map per mesh is supported
+            if len( object.data.uv_layers ) > 1:
+                removeDuplimeshes( list_objects )
+                raise Error( ' Each mesh must have only one UVmap' )
+
+            self.tvertlist = self.uvchannel( object, 0 )
             self.numtvertex = self.tvertlist.length
-            self.numtvfaces = int(len( object.data.uv_layer_stencil.data ) / 3)
+            self.numtvfaces = len( self.triverts )
             self.tfacelist = cTFacelist( self.numtvfaces )
             self.uvmapchannels = self.uvdump( object )
 
@@ -474,15 +457,15 @@ class cMesh:
 
         self.timevalue = '0'
         self.numvertex = len( object.data.vertices )
-        self.numfaces = len( object.data.polygons )
+        self.numfaces = len( self.triverts )
         self.vertlist = cVertlist( object )
-        self.facelist = cFacelist( object )
+        self.facelist = cFacelist( object, self.triverts, self.tripolys, collision )
 
         # Vertex Paint
         if len( object.data.vertex_colors ) > 0:
-            self.cvertlist = cCVertlist( object )
+            self.cvertlist = cCVertlist( object, self.triloops )
             self.numcvertex = self.cvertlist.length
-            self.numcvfaces = len( object.data.vertex_colors.data.polygons )
+            self.numcvfaces = len( self.triverts )
             self.cfacelist = cCFacelist( self.numcvfaces )
             # change them into strings now
             self.cvertlist = '\n{0}'.format( self.cvertlist )
@@ -495,7 +478,7 @@ class cMesh:
             self.numcvfaces = ''
             self.cfacelist = ''
 
-        self.normals = cNormallist( object )
+        self.normals = cNormallist( object, self.triverts, self.tripolys )
 
     # get uv layer names for specified object
     def getUVLayerNames( self, object ):
@@ -504,25 +487,24 @@ class cMesh:
         for uv in obj.uv_layers.keys():
             self.uvLayerNames.append( str( uv ) )
 
+    # TVERT list of one UV layer
+    def uvchannel( self, object, index ):
+        return cTVertlist( object, self.triloops, index )
+
     def uvdump( self, object ):
-        self.mappingchannels = ''
+        mappingchannels = io.StringIO()
         # if there is more than 1 uv layer
-        if collisionObject( object ) == False:
+        if not self.collision:
             self.getUVLayerNames( object )
             # if len( self.uvLayerNames ) > 1:
-            # save uv actives
-            active_uv = object.data.uv_layers.active_index
-            obj = object.data
             activeUV = 0
             for uvname in self.uvLayerNames:
                 if activeUV == 0:
                     activeUV += 1
                     continue
-                obj.uv_layers.active_index = activeUV
-                obj.uv_layer_stencil_index = activeUV
-                self.uvm_tvertlist = cTVertlist( object )
+                self.uvm_tvertlist = self.uvchannel( object, activeUV )
+                self.uvm_numtvfaces = len( self.triverts )
                 self.uvm_numtvertex = self.uvm_tvertlist.length
-                self.uvm_numtvfaces = len( object.data.uv_layer_stencil.data ) / 3
                 self.uvm_tfacelist = cTFacelist( self.uvm_numtvfaces )
 
                 # if len(object.data.vertex_colors) > 0:
@@ -542,342 +524,204 @@ class cMesh:
                 self.uvm_cfacelist = ''
 
                 # print extra mapping channels
-                self.mappingchannels += '''\n\t\t*MESH_MAPPINGCHANNEL {0} {{\n\t\t\t*MESH_NUMTVERTEX {1}\n\t\t\t*MESH_TVERTLIST {2}\n\t\t*MESH_NUMTVFACES {3}\n\t\t*MESH_TFACELIST {4}{5}{6}{7}{8}\n\t\t}}'''.format( str( activeUV + 1 ), self.uvm_numtvertex, self.uvm_tvertlist, self.uvm_numtvfaces, self.uvm_tfacelist, self.uvm_numcvertex, self.uvm_cvertlist, self.uvm_numcvfaces, self.uvm_cfacelist )
+                mappingchannels.write( '''\n\t\t*MESH_MAPPINGCHANNEL {0} {{\n\t\t\t*MESH_NUMTVERTEX {1}\n\t\t\t*MESH_TVERTLIST {2}\n\t\t*MESH_NUMTVFACES {3}\n\t\t*MESH_TFACELIST {4}{5}{6}{7}{8}\n\t\t}}'''.format( str( activeUV + 1 ), self.uvm_numtvertex, self.uvm_tvertlist, self.uvm_numtvfaces, self.uvm_tfacelist, self.uvm_numcvertex, self.uvm_cvertlist, self.uvm_numcvfaces, self.uvm_cfacelist ) )
                 activeUV = activeUV + 1
 
-            # restore uv actives
-            object.data.uv_layers.active_index = active_uv
-
+        self.mappingchannels = mappingchannels.getvalue()
         return self.mappingchannels
 
     # UV textures go AFTER MESH_FACE_LIST
     # MESH_NUMTVERTEX, MESH_TVERTLIST, MESH_NUMTVFACES, MESH_TFACELIST         
+    def write( self, file ):
+        file.write( '''\t*MESH {{\n\t\t*TIMEVALUE {0}\n\t\t*MESH_NUMVERTEX {1}\n\t\t*MESH_NUMFACES {2}\n\t\t*MESH_VERTEX_LIST '''.format( self.timevalue, self.numvertex, self.numfaces ).encode() )
+        for part in ( self.vertlist, '\n\t\t*MESH_FACE_LIST ', self.facelist, self.numtvertex_str, self.tvertlist_str, self.numtvfaces_str, self.tfacelist_str, self.numcvertex, self.cvertlist, self.numcvfaces, self.cfacelist, self.uvmapchannels, '\n', self.normals, '\n\t}' ):
+            file.write( str( part ).encode() )
+
     def __repr__( self ):
-        temp = '''\t*MESH {{\n\t\t*TIMEVALUE {0}\n\t\t*MESH_NUMVERTEX {1}\n\t\t*MESH_NUMFACES {2}\n\t\t*MESH_VERTEX_LIST {3}\n\t\t*MESH_FACE_LIST {4}{5}{6}{7}{8}{9}{10}{11}{12}{13}\n{14}\n\t}}'''.format( self.timevalue, self.numvertex, self.numfaces, self.vertlist, self.facelist, self.numtvertex_str, self.tvertlist_str, self.numtvfaces_str, self.tfacelist_str, self.numcvertex, self.cvertlist, self.numcvfaces, self.cfacelist, self.uvmapchannels, self.normals )
-        return temp
+        buf = io.BytesIO()
+        self.write( buf )
+        return buf.getvalue().decode()
 class cVertlist:
     def __init__( self, object ):
-        self.vertlist = []
-        for data in object.data.vertices:
-            temp = cVert( data.index, data.co.to_tuple( 4 ) )
-            self.vertlist.append( temp )
-
-    def dump( self ):
-        temp = ''
-        for x in self.vertlist:
-            temp += str( x )
-        return temp
+        vertices = object.data.vertices
+        co = np.empty( len( vertices ) * 3, dtype = np.float32 )
+        vertices.foreach_get( 'co', co )
+        co = np.round( co.reshape( -1, 3 ).astype( np.float64 ), 4 ) * optionScale
+        self.dump = aseLines( '\t\t\t*MESH_VERTEX %d % 0.4f % 0.4f % 0.4f\n', co )
 
     def __repr__( self ):
-        return '''{{\n{0}\t\t}}'''.format( self.dump() )
-class cVert:
-    def __init__( self, index, coord ):
-        global optionScale
-
-        self.index = index
-        self.x = aseFloat( coord[0] * optionScale )
-        self.y = aseFloat( coord[1] * optionScale )
-        self.z = aseFloat( coord[2] * optionScale )
-
-    def __repr__( self ):
-        return '''\t\t\t*MESH_VERTEX {0} {1} {2} {3}\n'''.format( self.index, self.x, self.y, self.z )
+        return '''{{\n{0}\t\t}}'''.format( self.dump )
 class cFacelist:
-    def __init__( self, object ):
+    def __init__( self, object, corners, polys, collision ):
         global optionAllowMultiMats
-        global matList
+        global matIndex
         global numMats
         global currentMatId
         global list_objects
-        import bpy
 
+        mesh = object.data
+        count = len( corners )
 
-        self.facelist = []
-        sgID = 0
-
+        # Material ids, looked up once per slot instead of once per face
+        if optionAllowMultiMats:
+            if not collision:
+                if count > 0 and object.type == 'MESH' and ('UCX_') not in object.name:
+                    if len(object.data.materials) == 0:
+                        removeDuplimeshes(list_objects)
+                        raise Error('A material is missing in at least one of view layer meshes')
+                slotids = np.array( [matIndex.get( slot.material.name, -1 ) if slot.material else -1 for slot in object.material_slots], dtype = np.int32 )
+                faceslots = np.empty( len( mesh.polygons ), dtype = np.int32 )
+                mesh.polygons.foreach_get( 'material_index', faceslots )
+                faceslots = faceslots[polys]
+                # A stale material index points past the last slot
+                if ( faceslots >= len( slotids ) ).any():
+                    removeDuplimeshes(list_objects)
+                    raise Error('A material is missing in at least one of view layer meshes')
+                self.matids = slotids[faceslots]
+                if ( self.matids < 0 ).any():
+                    removeDuplimeshes(list_objects)
+                    raise Error('A material is missing in at least one of view layer meshes')
+            else:
+                self.matids = np.zeros( count, dtype = np.int32 )
+        else:
+            self.matids = np.full( count, currentMatId, dtype = np.int32 )
 
         # Define smoothing groups (if enabled)
-        if ( collisionObject( object ) == False ):
+        self.sgids = np.zeros( count, dtype = np.int32 )
+        if not collision:
             if ( optionSmoothingGroups ):
-                self.smoothing_groups = defineSmoothing( self, object )
+                self.smoothing_groups = defineSmoothing( object )
+                #TODO: Compress sg's
+                self.sgids = self.smoothing_groups[polys] % 32
             else:
                 self.smoothing_groups = ''
 
-
-        for face in object.data.polygons:
-            if optionAllowMultiMats:
-                if (collisionObject(object) == False):
-                    if object.type == 'MESH' and ('UCX_') not in object.name:
-                            if len(object.data.materials) == 0:
-                                removeDuplimeshes(list_objects)
-                                raise Error('A material is missing in at least one of view layer meshes')
-                    self.matid = matList.index( object.material_slots[face.material_index].material.name )
-                else:
-                    self.matid = 0
-            else:
-                self.matid = currentMatId
-
-            if ( collisionObject( object ) == False ):
-                if ( optionSmoothingGroups ):
-                    for group in self.smoothing_groups:
-                        if group.count( face.index ) == 0:
-                            continue
-                        else:
-                            #TODO: Compress sg's
-                            index = self.smoothing_groups.index( group )
-                            sgID = index % 32
-
-            temp = '''\t\t\t*MESH_FACE {0}: A: {1} B: {2} C: {3} AB: 0 BC: 0 CA: 0 *MESH_SMOOTHING {4} *MESH_MTLID {5}\n'''.format( face.index, face.vertices[0], face.vertices[1], face.vertices[2], sgID, self.matid )
-            self.facelist.append( temp )
+        self.dump = aseLines( '\t\t\t*MESH_FACE %d: A: %d B: %d C: %d AB: 0 BC: 0 CA: 0 *MESH_SMOOTHING %d *MESH_MTLID %d\n', np.column_stack( ( corners, self.sgids, self.matids ) ) )
 
         if currentMatId < numMats - 1:
             currentMatId += 1
         else:
             currentMatId = 0
 
-    def dump( self ):
-        temp = ''
-        for x in self.facelist:
-            temp = temp + str( x )
-        return temp
-
     def __repr__( self ):
-        return '''{{\n{0}\t\t}}'''.format( self.dump() )
+        return '''{{\n{0}\t\t}}'''.format( self.dump )
 class cTVertlist:
-    def __init__( self, object):
-        self.vertlist = []
-
-        # update tessface
-        mesh = bpy.context.object.data
-        mesh.update()
-        mesh.calc_loop_triangles()
-
-        for index, face in enumerate( object.data.loop_triangles ):
-            if len( object.data.uv_layers ) == 0:
-                removeDuplimeshes (list_objects)
-                raise Error( "No UV texture map assigned to Mesh ") #+ object.name )
-            else:
-                temp = cTVert( ( index * 3 ) + 0, object.data.uv_layers[object.data.uv_layers.active_index].data[face.index * 3 + 0].uv )
-                self.vertlist.append( temp )
-                temp = cTVert( ( index * 3 ) + 1, object.data.uv_layers[object.data.uv_layers.active_index].data[face.index * 3 + 1].uv )
-                self.vertlist.append( temp )
-                temp = cTVert( ( index * 3 ) + 2, object.data.uv_layers[object.data.uv_layers.active_index].data[face.index * 3 + 2].uv )
-                self.vertlist.append( temp )
-
-        self.length = len( self.vertlist )
-
-    def dump( self ):
-        temp = ''
-        for x in self.vertlist:
-            temp += str( x )
-        return temp
+    def __init__( self, object, loops, index ):
+        if len( loops ) == 0:
+            uv = np.empty( ( 0, 2 ), dtype = np.float32 )
+        elif len( object.data.uv_layers ) == 0:
+            removeDuplimeshes (list_objects)
+            raise Error( "No UV texture map assigned to Mesh ") #+ object.name )
+        else:
+            # Read the layer directly; switching the active layer triggers updates
+            data = object.data.uv_layers[index].data
+            uv = np.empty( len( data ) * 2, dtype = np.float32 )
+            data.foreach_get( 'uv', uv )
+            uv = uv.reshape( -1, 2 )[loops.ravel()]
 
-    def __repr__( self ):
-        return '''{{\n{0}\t\t}}'''.format( self.dump() )
-class cTVert:
-    def __init__( self, index, coord ):
-        self.index = index
-        self.u = aseFloat( coord[0] )
-        self.v = aseFloat( coord[1] )
+        self.length = len( uv )
+        self.dump = aseLines( '\t\t\t*MESH_TVERT %d % 0.4f % 0.4f 0.0000\n', uv )
 
     def __repr__( self ):
-        return '''\t\t\t*MESH_TVERT {0} {1} {2} 0.0000\n'''.format( self.index, self.u, self.v )
+        return '''{{\n{0}\t\t}}'''.format( self.dump )
 class cTFacelist:
     def __init__( self, facecount ):
-        self.facelist = []
-        if type(facecount) == float:
-            removeDuplimeshes(list_objects)
-            raise Error(' Each mesh must have only one UVmap')
-
-        for data in range(facecount):
-            temp = cTFace( data )
-            self.facelist.append( temp )
-
-    def dump( self ):
-        temp = ''
-        for x in self.facelist:
-            temp = temp + str( x )
-        return temp
-
-    def __repr__( self ):
-        return '''{{\n{0}\t\t}}'''.format( self.dump() )
-class cTFace:
-    def __init__( self, x ):
-        self.index = x
-        self.vertices = []
-        self.vertices.append( x * 3 )
-        self.vertices.append( ( x * 3 ) + 1 )
-        self.vertices.append( ( x * 3 ) + 2 )
+        self.dump = cornerLines( '\t\t\t*MESH_TFACE %d %d %d %d\n', facecount )
 
     def __repr__( self ):
-        return '''\t\t\t*MESH_TFACE {0} {1} {2} {3}\n'''.format( self.index, self.vertices[0], self.vertices[1], self.vertices[2] )
+        return '''{{\n{0}\t\t}}'''.format( self.dump )
 class cCVertlist:
-    def __init__( self, object ):
-        self.vertlist = []
-        self.index = 0
-
-        # Blender 2.63+
-        bpy.ops.object.mode_set( mode = 'OBJECT' )
-        object.data.calc_loop_triangles()
-
-        for face in object.data.loop_triangles:
-            temp = object.data.vertex_colors[0].data[face.index * 3 + 0].color
-            self.vertlist.append( cCVert( self.index, temp ) )
-            temp = object.data.vertex_colors[0].data[face.index * 3 + 1].color
-            self.vertlist.append( cCVert( self.index + 1, temp ) )
-            temp = object.data.vertex_colors[0].data[face.index * 3 + 2].color
-            self.vertlist.append( cCVert( self.index + 2, temp ) )
-            self.index += 3
-
-        self.length = len( self.vertlist )
+    def __init__( self, object, loops ):
+        data = object.data.vertex_colors[0].data
+        color = np.empty( len( data ) * 4, dtype = np.float32 )
+        data.foreach_get( 'color', color )
+        color = color.reshape( -1, 4 )[loops.ravel(), :3]
 
-    def dump( self ):
-        temp = ''
-        for x in self.vertlist:
-            temp = temp + str( x )
-        return temp
+        self.length = len( color )
+        self.dump = aseLines( '\t\t\t*MESH_VERTCOL %d % 0.4f % 0.4f % 0.4f\n', color )
 
     def __repr__( self ):
-        return '''\t\t*MESH_CVERTLIST {{\n{0}\t\t}}'''.format( self.dump() )
-class cCVert:
-    def __init__( self, index, temp ):
-        self.index = index
-        self.r = aseFloat( float( temp[0] ) )
-        self.g = aseFloat( float( temp[1] ) )
-        self.b = aseFloat( float( temp[2] ) )
-
-    def __repr__( self ):
-        return '''\t\t\t*MESH_VERTCOL {0} {1} {2} {3}\n'''.format( self.index, self.r, self.g, self.b )
+        return '''\t\t*MESH_CVERTLIST {{\n{0}\t\t}}'''.format( self.dump )
 class cCFacelist:
     def __init__( self, facecount ):
-        temp = [0 for x in range( facecount )]
-        self.facelist = []
-        for index, data in enumerate( temp ):
-            self.facelist.append( cCFace( index, data ) )
-
-    def dump( self ):
-        temp = ''
-        for x in self.facelist:
-            temp = temp + str( x )
-        return temp
+        self.dump = cornerLines( '\t\t\t*MESH_CFACE %d %d %d %d\n', facecount )
 
     def __repr__( self ):
-        return '''\t\t*MESH_CFACELIST {{\n{0}\t\t}}'''.format( self.dump() )
-class cCFace:
-    def __init__( self, index, data ):
-        self.index = index
-        self.vertices = []
-        self.vertices.append( index * 3 )
-        self.vertices.append( ( index * 3 ) + 1 )
-        self.vertices.append( ( index * 3 ) + 2 )
-
-    def __repr__( self ):
-        return '''\t\t\t*MESH_CFACE {0} {1} {2} {3}\n'''.format( self.index, self.vertices[0], self.vertices[1], self.vertices[2] )
+        return '''\t\t*MESH_CFACELIST {{\n{0}\t\t}}'''.format( self.dump )
 class cNormallist:
-    def __init__( self, object ):
-        self.normallist = []
-        for face in object.data.polygons:
-            self.normallist.append( cNormal( face, object ) )
-
-    def dump( self ):
-        temp = ''
-        for x in self.normallist:
-            temp = temp + str( x )
-        return temp
-
-    def __repr__( self ):
-        return '''\t\t*MESH_NORMALS {{\n{0}\t\t}}'''.format( self.dump() )
-class cNormal:
-    def __init__( self, face, object ):
-        self.faceindex = face.index
-        self.facenormal = [aseFloat( x ) for x in face.normal.to_tuple( 4 )]
-        self.vertnormals = []
-        for x in face.vertices:
-            self.vertnormals.append( [x, [aseFloat( y ) for y in object.data.vertices[x].normal.to_tuple( 4 )]] )
+    def __init__( self, object, corners, polys ):
+        mesh = object.data
+
+        facenormals = np.empty( len( mesh.polygons ) * 3, dtype = np.float32 )
+        mesh.polygons.foreach_get( 'normal', facenormals )
+        vertexnormals = np.empty( len( mesh.vertices ) * 3, dtype = np.float32 )
+        mesh.vertices.foreach_get( 'normal', vertexnormals )
+
+        facenormals = np.round( facenormals.reshape( -1, 3 ).astype( np.float64 ), 4 )[polys]
+        vertexnormals = np.round( vertexnormals.reshape( -1, 3 ).astype( np.float64 ), 4 )
+
+        columns = [facenormals]
+        for x in range( 3 ):
+            columns.append( corners[:, x] )
+            columns.append( vertexnormals[corners[:, x]] )
+        self.dump = aseLines( '\t\t\t*MESH_FACENORMAL %d % 0.4f % 0.4f % 0.4f\n'
+                              '\t\t\t\t*MESH_VERTEXNORMAL %d % 0.4f % 0.4f % 0.4f\n'
+                              '\t\t\t\t*MESH_VERTEXNORMAL %d % 0.4f % 0.4f % 0.4f\n'
+                              '\t\t\t\t*MESH_VERTEXNORMAL %d % 0.4f % 0.4f % 0.4f\n', np.column_stack( columns ) )
 
     def __repr__( self ):
-        return '''\t\t\t*MESH_FACENORMAL {0} {1} {2} {3}\n\t\t\t\t*MESH_VERTEXNORMAL {4} {5} {6} {7}\n\t\t\t\t*MESH_VERTEXNORMAL {8} {9} {10} {11}\n\t\t\t\t*MESH_VERTEXNORMAL {12} {13} {14} {15}\n'''.format( self.faceindex, self.facenormal[0], self.facenormal[1], self.facenormal[2], self.vertnormals[0][0], self.vertnormals[0][1][0], self.vertnormals[0][1][1], self.vertnormals[0][1][2], self.vertnormals[1][0], self.vertnormals[1][1][0], self.vertnormals[1][1][1], self.vertnormals[1][1][2], self.vertnormals[2][0], self.vertnormals[2][1][0], self.vertnormals[2][1][1], self.vertnormals[2][1][2] )
+        return '''\t\t*MESH_NORMALS {{\n{0}\t\t}}'''.format( self.dump )
 
 #== Smoothing Groups and Helper Methods =================================
-def defineSmoothing( self, object ):
+def defineSmoothing( object ):
     print( object.name + ": Constructing Smoothing Groups" )
 
-    seam_edge_list = []
-    sharp_edge_list = []
-
-    _mode = bpy.context.active_object.mode
-    bpy.ops.object.mode_set( mode = 'EDIT' )
-    bpy.ops.mesh.select_all( action = 'DESELECT' )
-    setSelMode( 'EDGE' )
-
-    # Get seams and clear them
-    bpy.ops.object.mode_set( mode = 'OBJECT' )
-    for edge in object.data.edges:
-        if edge.use_seam:
-            seam_edge_list.append( edge.index )
-            edge.select = True
-
-    bpy.ops.object.mode_set( mode = 'EDIT' )
-    bpy.ops.mesh.select_all( action = 'SELECT' )
-    bpy.ops.mesh.mark_seam( clear = True )
-
-    # Get sharp edges, convert them to seams
-    bpy.ops.mesh.select_all( action = 'DESELECT' )
-    bpy.ops.object.mode_set( mode = 'OBJECT' )
-    for edge in object.data.edges:
-        if edge.use_edge_sharp:
-            sharp_edge_list.append( edge )
-            edge.select = True
-
-    bpy.ops.object.mode_set( mode = 'EDIT' )
-    bpy.ops.mesh.mark_seam()
-
-    bpy.ops.mesh.select_all( action = 'DESELECT' )
-
-    smoothing_groups = []
-    face_list = []
-
-    mode = getSelMode( self, False )
-    setSelMode( 'FACE' )
-
-    for face in object.data.polygons:
-        face_list.append( face.index )
-
-    while len( face_list ) > 0:
-        bpy.ops.object.mode_set( mode = 'OBJECT' )
-        object.data.polygons[face_list[0]].select = True
-        bpy.ops.object.mode_set( mode = 'EDIT' )
-        bpy.ops.mesh.select_linked( delimit = {'SEAM'} )
-
-        # TODO - update when API is updated
-        selected_faces = getSelectedFaces( self, True )
-        smoothing_groups.append( selected_faces )
-        for face_index in selected_faces:
-            if face_list.count( face_index ) > 0:
-                face_list.remove( face_index )
-        bpy.ops.mesh.select_all( action = 'DESELECT' )
-
-    setSelMode( mode, False )
-
-    # Clear seams created by sharp edges
-    bpy.ops.object.mode_set( mode = 'OBJECT' )
-    for edge in object.data.edges:
-        if edge.use_seam:
-            edge.select = True
-
-    bpy.ops.object.mode_set( mode = 'EDIT' )
-    bpy.ops.mesh.mark_seam( clear = True )
-
-    bpy.ops.mesh.select_all( action = 'DESELECT' )
-    # Restore original uv seams
-    bpy.ops.object.mode_set( mode = 'OBJECT' )
-    for edge_index in seam_edge_list:
-        object.data.edges[edge_index].select = True
-
-    bpy.ops.object.mode_set( mode = 'EDIT' )
-    bpy.ops.mesh.mark_seam()
-
-    print( '\t' + str( len( smoothing_groups ) ) + ' smoothing groups found.' )
-    return smoothing_groups
+    mesh = object.data
+    numfaces = len( mesh.polygons )
+
+    # Owning face and edge of every loop; loop_start is used rather than
+    # assuming each face's loops follow the previous face's
+    looptotals = np.empty( numfaces, dtype = np.int32 )
+    mesh.polygons.foreach_get( 'loop_total', looptotals )
+    loopstarts = np.empty( numfaces, dtype = np.int32 )
+    mesh.polygons.foreach_get( 'loop_start', loopstarts )
+    faces = np.repeat( np.arange( numfaces ), looptotals )
+    corners = np.arange( len( faces ) ) - np.repeat( np.cumsum( looptotals ) - looptotals, looptotals )
+    loopfaces = np.empty( len( mesh.loops ), dtype = faces.dtype )
+    loopfaces[loopstarts[faces] + corners] = faces
+    loopedges = np.empty( len( mesh.loops ), dtype = np.int32 )
+    mesh.loops.foreach_get( 'edge_index', loopedges )
+    sharp = np.empty( len( mesh.edges ), dtype = bool )
+    mesh.edges.foreach_get( 'use_edge_sharp', sharp )
+
+    # Pair up the faces that share an edge which is not marked sharp; UV seams
+    # don't split groups (the old operator path cleared them before select_linked)
+    order = np.argsort( loopedges, kind = 'stable' )
+    loopedges = loopedges[order]
+    loopfaces = loopfaces[order]
+    linked = ( loopedges[1:] == loopedges[:-1] ) & ~sharp[loopedges[1:]]
+    facesa = loopfaces[:-1][linked]
+    facesb = loopfaces[1:][linked]
+
+    # Union-find: hook the larger root onto the smaller one, then compress
+    parent = np.arange( numfaces )
+    while True:
+        rootsa = parent[facesa]
+        rootsb = parent[facesb]
+        if ( rootsa == rootsb ).all():
+            break
+        np.minimum.at( parent, np.maximum( rootsa, rootsb ), np.minimum( rootsa, rootsb ) )
+        while True:
+            grandparent = parent[parent]
+            if ( grandparent == parent ).all():
+                break
+            parent = grandparent
+
+    # Every root is the lowest face index of its island, so groups keep face order
+    roots, smoothing_groups = np.unique( parent, return_inverse = True )
+
+    print( '\t' + str( len( roots ) ) + ' smoothing groups found.' )
+    return smoothing_groups.reshape( -1 )
 
 #=================================================================================
 #   Deletes duplicated selected meshes after ASE export writing or raise error.
@@ -907,56 +751,41 @@ def collisionObject( object ):
             return True
     return False
 
-# Set the selection mode    
-def setSelMode( mode, default = True ):
-    if default:
-        if mode == 'VERT':
-            bpy.context.tool_settings.mesh_select_mode = [True, False, False]
-        elif mode == 'EDGE':
-            bpy.context.tool_settings.mesh_select_mode = [False, True, False]
-        elif mode == 'FACE':
-            bpy.context.tool_settings.mesh_select_mode = [False, False, True]
-        else:
-            return False
-    else:
-        bpy.context.tool_settings.mesh_select_mode = mode
-        return True
-def getSelMode( self, default = True ):
-    if default:
-        if bpy.context.tool_settings.mesh_select_mode[0] == True:
-            return 'VERT'
-        elif bpy.context.tool_settings.mesh_select_mode[1] == True:
-            return 'EDGE'
-        elif bpy.context.tool_settings.mesh_select_mode[2] == True:
-            return 'FACE'
-        return False
-    else:
-        mode = []
-        for value in bpy.context.tool_settings.mesh_select_mode:
-            mode.append( value )
-
-        return mode
-def getSelectedFaces( self, index = False ):
-    selected_faces = []
-    # Update mesh data
-    bpy.ops.object.editmode_toggle()
-    bpy.ops.object.editmode_toggle()
-
-    _mode = bpy.context.active_object.mode
-    bpy.ops.object.mode_set( mode = 'EDIT' )
-
-    object = bpy.context.active_object
-    for face in object.data.polygons:
-        if face.select == True:
-            if index == False:
-                selected_faces.append( face )
-            else:
-                selected_faces.append( face.index )
-
-    bpy.ops.object.mode_set( mode = _mode )
-
-    return selected_faces
-
+# Principled BSDF of a material, looked up once per export
+def findPrincipled( material ):
+    global principledNodes
+    if material.name not in principledNodes:
+        nodes = material.node_tree.nodes
+        principledNodes[material.name] = next( n for n in nodes if n.type == 'BSDF_PRINCIPLED' )
+    return principledNodes[material.name]
+
+# MAP_DIFFUSE block of a material, built once per export
+def diffuseMap( material ):
+    global diffuseMaps
+    key = material.name if material else None
+    if key not in diffuseMaps:
+        diffuseMaps[key] = cDiffusemap( material )
+    return diffuseMaps[key]
+
+# Format one line per row of values, prefixed with the row index
+def aseLines( template, values ):
+    rows = np.column_stack( ( np.arange( len( values ) ), values ) )
+    return ( template * len( rows ) ) % tuple( rows.ravel().tolist() )
+
+# Corner loops, corner vertices and source polygon of every loop triangle
+def loopTriangles( mesh ):
+    count = len( mesh.loop_triangles )
+    loops = np.empty( count * 3, dtype = np.int32 )
+    mesh.loop_triangles.foreach_get( 'loops', loops )
+    verts = np.empty( count * 3, dtype = np.int32 )
+    mesh.loop_triangles.foreach_get( 'vertices', verts )
+    polys = np.empty( count, dtype = np.int32 )
+    mesh.loop_triangles.foreach_get( 'polygon_index', polys )
+    return loops.reshape( -1, 3 ), verts.reshape( -1, 3 ), polys
+
+# Face lines indexing three consecutive corners
+def cornerLines( template, facecount ):
+    return aseLines( template, np.arange( facecount * 3 ).reshape( -1, 3 ) )
 
 
 #== Core ===================================================================
@@ -1064,15 +893,13 @@ class ExportAse( bpy.types.Operator, ExportHelper ):
         ok = selected or camera
         return ok
 
-    def writeASE( self, filename, data ):
+    def openASE( self, filename ):
         print( '\nWriting', filename )
         try:
-            file = open( filename, 'w' )
+            return open( filename, 'wb', buffering = 1 << 20 )
         except IOError:
             print( 'Error: The file could not be written to. Aborting.' )
-        else:
-            file.write( data )
-            file.close()
+            return None
 
     def execute( self, context ):
         start = time.time()
@@ -1085,12 +912,14 @@ class ExportAse( bpy.types.Operator, ExportHelper ):
         global aseHeader
         global aseScene
         global aseMaterials
-        global aseGeometry
 
         global currentMatId
         global numMats
         global matList
+        global matIndex
         global list_objects
+        global principledNodes
+        global diffuseMaps
 
 
         import bpy
@@ -1099,7 +928,6 @@ class ExportAse( bpy.types.Operator, ExportHelper ):
         aseHeader = ''
         aseScene = ''
         aseMaterials = ''
-        aseGeometry = ''
 
         optionScale = self.option_scale
         optionSubmaterials = self.option_submaterials
@@ -1107,17 +935,23 @@ class ExportAse( bpy.types.Operator, ExportHelper ):
         optionAllowMultiMats = self.option_allowmultimats
 
         matList = []
+        matIndex = {}
         currentMatId = 0
         numMats = 0
-        list_objects = []
+        principledNodes = {}
+        diffuseMaps = {}
+
+        # Make a list of selected objects, object names are unique already
+        list_objects = [obj.name for obj in bpy.context.selected_objects]
 
-        # Make a list of selected objects
-        for obj in bpy.context.selected_objects:
-            if obj not in list_objects:
-                list_objects.append(obj.name)
+        # Check the materials before anything gets duplicated
+        meshes = [obj for obj in bpy.context.selected_objects if obj.type == 'MESH' and collisionObject( obj ) == False]
+        if any( slot.material is None for obj in meshes for slot in obj.material_slots ):
+            raise Error( 'A material is missing in at least one of view layer meshes' )
+        if not any( obj.material_slots for obj in meshes ):
+            raise Error( 'Mesh must have at least one applied material' )
 
         # Duplicate selected meshes
-        selected_objects = [o for o in bpy.context.scene.objects if o.select_get()]
         bpy.ops.object.duplicate()
         objx = bpy.context.selected_objects
         # Rename duplicated objects
@@ -1136,68 +970,81 @@ class ExportAse( bpy.types.Operator, ExportHelper ):
         aseScene = str( cScene() )
         aseMaterials = str( cMaterials() )
 
+        # Stream the ASE file, one geometry object at a time, into a temp file
+        # so a failed export leaves any previous file at filepath untouched
+        tempname = self.filepath + '.tmp'
+        file = self.openASE( tempname )
+        if file is None:
+            removeDuplimeshes( list_objects )
+            return {'CANCELLED'}
+
+        try:
+            file.write( aseHeader.encode() )
+            file.write( aseScene.encode() )
+            file.write( aseMaterials.encode() )
+            self.writeGeometry( file )
+        except Exception:
+            file.close()
+            os.remove( tempname )
+            raise
+        file.close()
+        os.replace( tempname, self.filepath )
+
+        lapse = ( time.time() - start )
+        print( 'Completed in ' + str( lapse ) + ' seconds' )
+
+        # Select objects by type and delete selected duplicate mesh objects
+        removeDuplimeshes (list_objects)
 
 
+        return {'FINISHED'}
+
+    def writeGeometry( self, file ):
         # Apply applicable options
         for object in bpy.context.selected_objects:
             if object.type == 'MESH':
                 bpy.context.view_layer.objects.active = object
                 bpy.context.active_object.select_set(state=True)
 
-                # Options
-                bpy.ops.object.mode_set( mode = 'EDIT' )
-                if self.option_remove_doubles:
-                    bpy.ops.object.mode_set( mode = 'EDIT' )
-                    bpy.ops.mesh.select_all( action = 'SELECT' )
-                    bpy.ops.mesh.remove_doubles()
-                if self.option_triangulate:
-                    print( object.name + ': Converting to triangles' )
-                    bpy.ops.mesh.select_all( action = 'SELECT' )
-                    bpy.ops.mesh.quads_convert_to_tris()
-                if self.option_normals:
-                    print( object.name + ': Recalculating normals' )
-                    bpy.ops.object.mode_set( mode = 'EDIT' )
-                    bpy.ops.mesh.select_all( action = 'SELECT' )
-                    bpy.ops.mesh.normals_make_consistent()
+                # Options, applied with bmesh instead of edit mode operators
+                bpy.ops.object.mode_set( mode = 'OBJECT' )
+                if self.option_remove_doubles or self.option_triangulate or self.option_normals:
+                    bm = bmesh.new()
+                    bm.from_mesh( object.data )
+                    if self.option_remove_doubles:
+                        # Same merge distance as the Merge by Distance operator
+                        bmesh.ops.remove_doubles( bm, verts = bm.verts, dist = 0.0001 )
+                    if self.option_triangulate:
+                        print( object.name + ': Converting to triangles' )
+                        bmesh.ops.triangulate( bm, faces = bm.faces, quad_method = 'BEAUTY', ngon_method = 'BEAUTY' )
+                    if self.option_normals:
+                        print( object.name + ': Recalculating normals' )
+                        bmesh.ops.recalc_face_normals( bm, faces = bm.faces )
+                    bm.to_mesh( object.data )
+                    bm.free()
 
                 # Transformations
-                bpy.ops.object.mode_set( mode = 'OBJECT' )
                 bpy.ops.object.transform_apply( location = self.option_apply_location, rotation = self.option_apply_rotation, scale = self.option_apply_scale )
 
                 #Construct ASE Geometry Nodes
-                aseGeometry += str( cGeomObject( object ) )
+                cGeomObject( object ).write( file )
 
             else:
                 continue
 
-        aseModel = ''
-        aseModel += aseHeader
-        aseModel += aseScene
-        aseModel += aseMaterials
-        aseModel += aseGeometry
-
-        # Write the ASE file
-        self.writeASE( self.filepath, aseModel )
-
-        lapse = ( time.time() - start )
-        print( 'Completed in ' + str( lapse ) + ' seconds' )
-
-        # Select objects by type and delete selected duplicate mesh objects
-        removeDuplimeshes (list_objects)
-
-
-        return {'FINISHED'}
-
 def menu_func( self, context ):
     self.layout.operator( ExportAse.bl_idname, text = "ASCII Scene Exporter (.ase)" )
 
+classes = ( ExportAse, )
+register_classes, unregister_classes = bpy.utils.register_classes_factory( classes )
+
 def register():
-    bpy.utils.register_class( ExportAse )
+    register_classes()
     bpy.types.TOPBAR_MT_file_export.append( menu_func )
 
 def unregister():
-    bpy.utils.unregister_class( ExportAse )
     bpy.types.TOPBAR_MT_file_export.remove( menu_func )
+    unregister_classes()
 
 if __name__ == "__main__":
     register()